@@ -0,0 +1,52 @@
+"""
+文字轉換快取效能測試
+比較 inline 查詢在快取命中與未命中時的延遲
+
+執行方式（於 python-telegram-echo/ 目錄）：
+    python -m benchmarks.bench_transform_cache
+"""
+
+import time
+
+from transforms.text_transforms import MAX_TRANSFORM_LENGTH, TRANSFORMS, TransformCache
+
+ROUNDS = 20_000
+
+
+def bench_per_query(label: str, run) -> None:
+    """量測 ROUNDS 次 inline 查詢（套用全部轉換）的平均延遲"""
+    started = time.perf_counter_ns()
+    for index in range(ROUNDS):
+        run(index)
+    elapsed_ns = time.perf_counter_ns() - started
+    print(f"{label:<12} {elapsed_ns / ROUNDS / 1000:8.3f} µs/query")
+
+
+def main() -> None:
+    text = ("Hello Inline World " * 20)[:MAX_TRANSFORM_LENGTH]
+
+    def compute(index: int) -> None:
+        for transform in TRANSFORMS.values():
+            transform(text)
+
+    hit_cache = TransformCache()
+
+    def cache_hit(index: int) -> None:
+        for name in TRANSFORMS:
+            hit_cache.apply(name, text)
+
+    miss_cache = TransformCache(maxsize=ROUNDS * len(TRANSFORMS))
+
+    def cache_miss(index: int) -> None:
+        unique = f"{index}{text}"[:MAX_TRANSFORM_LENGTH]
+        for name in TRANSFORMS:
+            miss_cache.apply(name, unique)
+
+    bench_per_query("no cache", compute)
+    bench_per_query("cache miss", cache_miss)
+    bench_per_query("cache hit", cache_hit)
+    print(f"hit rate     {hit_cache.hit_rate:.2%}")
+
+
+if __name__ == "__main__":
+    main()
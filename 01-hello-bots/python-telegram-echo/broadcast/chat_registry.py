@@ -0,0 +1,103 @@
+"""
+聊天室 ID 登記模組
+以 append-only 的二進位檔保存曾互動過的聊天室 ID（每筆固定 8 bytes），
+另以退役紀錄檔標記已封鎖、已刪除或已遷移、不應再廣播的 ID
+"""
+
+import os
+import struct
+from typing import Iterator, List, Set, Tuple
+
+# 每筆紀錄：little-endian 有號 64 位元整數
+_RECORD = struct.Struct("<q")
+# 退役紀錄：(聊天室 ID, 1=退役 / 0=恢復)
+_RETIRE_RECORD = struct.Struct("<qB")
+
+
+class ChatRegistry:
+    """
+    磁碟上的聊天室 ID 集合
+
+    每個 ID 只寫入一次，檔案內的順序即登記順序，
+    因此可以用「第幾筆」當作廣播進度的 offset，並從磁碟分批讀取。
+    退役的 ID 仍保留在主檔（offset 不變），由廣播端以 is_retired 略過；
+    退役的聊天室之後再傳訊息給 bot 時會自動恢復。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.retired_path = f"{path}.retired"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._ids: Set[int] = {
+            chat_id for (chat_id,) in self._load_records(self.path, _RECORD)
+        }
+        self._retired: Set[int] = set()
+        for chat_id, retired in self._load_records(self.retired_path, _RETIRE_RECORD):
+            if retired:
+                self._retired.add(chat_id)
+            else:
+                self._retired.discard(chat_id)
+        self._file = open(path, "ab")
+        self._retired_file = open(self.retired_path, "ab")
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._ids
+
+    def add(self, chat_id: int) -> bool:
+        """登記聊天室 ID（已退役則恢復），回傳是否為新 ID"""
+        if chat_id in self._retired:
+            self._write_retired(chat_id, False)
+        if chat_id in self._ids:
+            return False
+        self._file.write(_RECORD.pack(chat_id))
+        self._file.flush()
+        self._ids.add(chat_id)
+        return True
+
+    def retire(self, chat_id: int) -> None:
+        """標記聊天室不再接收廣播"""
+        if chat_id not in self._retired:
+            self._write_retired(chat_id, True)
+
+    def is_retired(self, chat_id: int) -> bool:
+        """聊天室是否已退役"""
+        return chat_id in self._retired
+
+    def read_batch(self, offset: int, count: int) -> List[int]:
+        """從第 offset 筆開始讀取最多 count 筆 ID（含已退役的 ID）"""
+        with open(self.path, "rb") as f:
+            f.seek(offset * _RECORD.size)
+            data = f.read(count * _RECORD.size)
+        usable = len(data) - len(data) % _RECORD.size
+        return [chat_id for (chat_id,) in _RECORD.iter_unpack(data[:usable])]
+
+    def close(self) -> None:
+        """關閉檔案"""
+        self._file.close()
+        self._retired_file.close()
+
+    def _write_retired(self, chat_id: int, retired: bool) -> None:
+        self._retired_file.write(_RETIRE_RECORD.pack(chat_id, int(retired)))
+        self._retired_file.flush()
+        if retired:
+            self._retired.add(chat_id)
+        else:
+            self._retired.discard(chat_id)
+
+    @staticmethod
+    def _load_records(path: str, record: struct.Struct) -> Iterator[Tuple]:
+        if not os.path.exists(path):
+            return iter(())
+        with open(path, "rb") as f:
+            data = f.read()
+        usable = len(data) - len(data) % record.size
+        if usable != len(data):
+            # 上次寫入中途當機留下不完整的紀錄，截掉以免錯位
+            with open(path, "r+b") as f:
+                f.truncate(usable)
+        return record.iter_unpack(data[:usable])
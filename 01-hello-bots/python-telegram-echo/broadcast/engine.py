@@ -0,0 +1,307 @@
+"""
+廣播引擎模組
+依全域發送速率分批送出訊息，並以檢查點記錄進度，重啟後可從中斷處繼續
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram.error import (
+    BadRequest,
+    ChatMigrated,
+    Forbidden,
+    NetworkError,
+    RetryAfter,
+    TelegramError,
+)
+
+from .chat_registry import ChatRegistry
+
+logger = logging.getLogger(__name__)
+
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+SendCallback = Callable[[int, str], Awaitable[Any]]
+ProgressCallback = Callable[["BroadcastJob", "BroadcastProgress"], Awaitable[None]]
+
+
+@dataclass
+class BroadcastJob:
+    """一次廣播任務，也是寫入檢查點的內容"""
+
+    job_id: str
+    text: str
+    total: int
+    report_chat_id: int
+    offset: int = 0
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    skipped: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """轉換為字典格式"""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BroadcastJob":
+        """從字典格式還原"""
+        return cls(**data)
+
+
+@dataclass
+class BroadcastProgress:
+    """廣播進度快照"""
+
+    total: int
+    processed: int
+    sent: int
+    blocked: int
+    failed: int
+    skipped: int
+    rate: float
+    eta_seconds: Optional[float]
+
+    def to_text(self) -> str:
+        """轉換為使用者友善的進度訊息"""
+        percent = self.processed / self.total * 100 if self.total else 100.0
+        eta = "計算中" if self.eta_seconds is None else f"{self.eta_seconds:.0f} 秒"
+        return (
+            f"📣 廣播進度：{self.processed}/{self.total}（{percent:.1f}%）\n"
+            f"✅ 成功 {self.sent}　🚫 封鎖/不存在 {self.blocked}　⚠️ 失敗 {self.failed}"
+            f"　⏭ 略過 {self.skipped}\n"
+            f"⏱ 速率 {self.rate:.1f} 則/秒，預估剩餘 {eta}"
+        )
+
+
+class RateLimiter:
+    """
+    全域發送速率控制
+
+    每次 acquire 預約下一個發送時段，時段間隔為 1 / rate 秒；
+    收到 RetryAfter 時以 pause 讓所有等待中的發送一起延後。
+    """
+
+    def __init__(self, rate: float):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+
+    async def acquire(self) -> None:
+        """等待直到可以送出下一則訊息"""
+        while True:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            if time.monotonic() >= self._paused_until:
+                return
+
+    def pause(self, seconds: float) -> None:
+        """暫停所有發送 seconds 秒"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class BroadcastEngine:
+    """
+    可續傳的廣播引擎
+
+    從 ChatRegistry 分批讀取聊天室 ID，經 RateLimiter 控速後送出；
+    每批完成後把進度寫入檢查點檔，當機重啟後呼叫 resume 即可接續。
+    封鎖、不存在或已遷移的聊天室會在 registry 中退役，之後的廣播直接略過。
+    檢查點在整批完成後才更新，因此重啟時最後一批可能重送（at-least-once）。
+    """
+
+    def __init__(
+        self,
+        registry: ChatRegistry,
+        send: SendCallback,
+        checkpoint_path: str,
+        rate: float = 25.0,
+        batch_size: int = 50,
+        max_attempts: int = 3,
+        progress_interval: float = 5.0,
+        on_progress: Optional[ProgressCallback] = None,
+    ):
+        self.registry = registry
+        self.send = send
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.progress_interval = progress_interval
+        self.on_progress = on_progress
+        self.limiter = RateLimiter(rate)
+        self.job: Optional[BroadcastJob] = None
+        self._task: Optional[asyncio.Task] = None
+        self._run_started_at = 0.0
+        self._run_started_offset = 0
+
+    @property
+    def is_running(self) -> bool:
+        """是否有廣播正在進行"""
+        return self._task is not None and not self._task.done()
+
+    def start(self, text: str, report_chat_id: int) -> BroadcastJob:
+        """建立新的廣播任務並開始執行"""
+        if self.is_running:
+            raise RuntimeError("a broadcast is already running")
+        job = BroadcastJob(
+            job_id=uuid.uuid4().hex[:8],
+            text=text,
+            total=len(self.registry),
+            report_chat_id=report_chat_id,
+        )
+        self._save_checkpoint(job)
+        self._launch(job)
+        return job
+
+    def resume(self) -> Optional[BroadcastJob]:
+        """若檢查點存在則接續未完成的廣播，回傳被接續的任務"""
+        if self.is_running or not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            job = BroadcastJob.from_dict(json.load(f))
+        self._launch(job)
+        return job
+
+    async def stop(self) -> None:
+        """停止目前的廣播但保留檢查點，供下次啟動時 resume"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def cancel(self) -> None:
+        """取消目前的廣播並刪除檢查點"""
+        await self.stop()
+        self._remove_checkpoint()
+
+    def progress(self) -> Optional[BroadcastProgress]:
+        """目前廣播的進度快照"""
+        job = self.job
+        if job is None:
+            return None
+        elapsed = time.monotonic() - self._run_started_at
+        done_this_run = job.offset - self._run_started_offset
+        rate = done_this_run / elapsed if elapsed > 0 else 0.0
+        remaining = job.total - job.offset
+        return BroadcastProgress(
+            total=job.total,
+            processed=job.offset,
+            sent=job.sent,
+            blocked=job.blocked,
+            failed=job.failed,
+            skipped=job.skipped,
+            rate=rate,
+            eta_seconds=remaining / rate if rate > 0 else None,
+        )
+
+    def _launch(self, job: BroadcastJob) -> None:
+        self.job = job
+        self._run_started_at = time.monotonic()
+        self._run_started_offset = job.offset
+        self._task = asyncio.create_task(self._run(job), name="broadcast")
+
+    async def _run(self, job: BroadcastJob) -> None:
+        last_report = time.monotonic()
+        while job.offset < job.total:
+            count = min(self.batch_size, job.total - job.offset)
+            chat_ids = await asyncio.to_thread(
+                self.registry.read_batch, job.offset, count
+            )
+            if not chat_ids:
+                break
+
+            outcomes = await asyncio.gather(
+                *(self._deliver(chat_id, job.text) for chat_id in chat_ids)
+            )
+            job.sent += outcomes.count(SENT)
+            job.blocked += outcomes.count(BLOCKED)
+            job.failed += outcomes.count(FAILED)
+            job.skipped += outcomes.count(SKIPPED)
+            job.offset += len(chat_ids)
+            self._save_checkpoint(job)
+
+            if time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                await self._report(job)
+
+        self._remove_checkpoint()
+        await self._report(job)
+        logger.info(
+            "Broadcast finished",
+            extra={"job_id": job.job_id, "sent": job.sent, "blocked": job.blocked},
+        )
+
+    async def _deliver(self, chat_id: int, text: str) -> str:
+        if self.registry.is_retired(chat_id):
+            return SKIPPED
+        for attempt in range(1, self.max_attempts + 1):
+            await self.limiter.acquire()
+            try:
+                await self.send(chat_id, text)
+                return SENT
+            except RetryAfter as e:
+                self.limiter.pause(e.retry_after)
+            except ChatMigrated as e:
+                # 群組升級為超級群組：舊 ID 退役，新 ID 已登記時由它自己的紀錄負責
+                self.registry.retire(chat_id)
+                if e.new_chat_id in self.registry:
+                    return SKIPPED
+                chat_id = e.new_chat_id
+                self.registry.add(chat_id)
+            except Forbidden:
+                self.registry.retire(chat_id)
+                return BLOCKED
+            except BadRequest as e:
+                if "chat not found" in str(e).lower():
+                    self.registry.retire(chat_id)
+                    return BLOCKED
+                logger.warning(f"Broadcast rejected for chat {chat_id}: {e}")
+                return FAILED
+            except NetworkError:
+                await asyncio.sleep(attempt)
+            except TelegramError as e:
+                logger.warning(f"Broadcast failed for chat {chat_id}: {e}")
+                return FAILED
+        return FAILED
+
+    async def _report(self, job: BroadcastJob) -> None:
+        progress = self.progress()
+        if self.on_progress is None or progress is None:
+            return
+        try:
+            await self.on_progress(job, progress)
+        except Exception:
+            # 回報失敗不影響廣播本身
+            logger.warning("Broadcast progress report failed", exc_info=True)
+
+    def _save_checkpoint(self, job: BroadcastJob) -> None:
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(), f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _remove_checkpoint(self) -> None:
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
@@ -90,7 +90,7 @@ class ErrorHandler:
 
                 # 取得 update 物件來回覆訊息
                 update = args[0] if args else None
-                if update and hasattr(update, "message"):
+                if update and getattr(update, "message", None):
                     await update.message.reply_text(user_message)
 
                 logger.warning(
@@ -107,7 +107,7 @@ class ErrorHandler:
                 user_message = error_response.to_user_message()
 
                 update = args[0] if args else None
-                if update and hasattr(update, "message"):
+                if update and getattr(update, "message", None):
                     await update.message.reply_text(user_message)
 
                 logger.error(
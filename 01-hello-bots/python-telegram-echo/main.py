@@ -1,27 +1,122 @@
 import os
+import asyncio
 import logging
-from telegram import Update, BotCommand
+from datetime import datetime
+from typing import Callable, Optional, TypeVar
+from telegram import (
+    Bot,
+    BotCommand,
+    InlineQueryResultArticle,
+    InlineQueryResultsButton,
+    InputTextMessageContent,
+    Message,
+    Update,
+)
 from telegram.ext import (
     Application,
     CommandHandler,
+    InlineQueryHandler,
     MessageHandler,
+    TypeHandler,
     filters,
     ContextTypes,
 )
 from dotenv import load_dotenv
 
 # 新增：匯入錯誤處理模組
-from errors.exceptions import UserInputError, DomainRuleError, SystemError
+from errors.exceptions import BaseAppError, UserInputError, DomainRuleError, SystemError
 from errors.handler import ErrorHandler, main_error_handler
+from broadcast.chat_registry import ChatRegistry
+from broadcast.engine import BroadcastEngine, BroadcastJob, BroadcastProgress
+from messaging.coalescer import (
+    TELEGRAM_MESSAGE_LIMIT,
+    MessageCoalescer,
+    telegram_length,
+)
+from profiling.sampler import SamplingProfiler, install_thread_attribution
+from storage.sqlite_persistence import SQLitePersistence
+from transforms.text_transforms import (
+    TRANSFORMS,
+    TRANSFORM_TITLES,
+    TransformCache,
+    validate_transform_text,
+)
 
 # 載入 .env 檔案
 load_dotenv()
 
+T = TypeVar("T")
+
 # 設定日誌
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 
+# 效能分析設定（/profile 指令）
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 600
+
+profiler = SamplingProfiler()
+_profile_stop_task: Optional[asyncio.Task] = None
+# 避免自動停止與 /profile stop 同時停止分析器
+_profile_lock = asyncio.Lock()
+
+
+# 回聲合併：ECHO_COALESCE_WINDOW_MS > 0 時啟用（預設關閉），設定於 main() 讀取
+async def _reply_coalesced(message: Message, text: str) -> None:
+    await message.reply_text(text)
+
+
+# 廣播設定（/broadcast 指令）
+BROADCAST_DATA_DIR = os.getenv("BROADCAST_DATA_DIR", "data")
+
+# 文字轉換結果快取（/upper 與 inline 查詢共用）
+INLINE_CACHE_TIME = 300
+transform_cache = TransformCache()
+
+
+def get_admin_ids() -> set[int]:
+    """從環境變數 ADMIN_USER_IDS（逗號分隔）讀取管理員使用者 ID。"""
+    raw = os.getenv("ADMIN_USER_IDS", "")
+    return {int(part) for part in raw.split(",") if part.strip().isdigit()}
+
+
+def get_env_number(name: str, default: str, cast: Callable[[str], T]) -> T:
+    """讀取數值型環境變數，格式錯誤時拋出使用者輸入錯誤。"""
+    raw = os.getenv(name, default)
+    try:
+        return cast(raw)
+    except ValueError:
+        raise UserInputError(
+            message=f"環境變數 {name} 格式錯誤",
+            hint=(
+                f"請在 .env 檔案中把 {name} 設為{'整數' if cast is int else '數字'}"
+                f"（目前為 {raw!r}）"
+            ),
+        ) from None
+
+
+def create_echo_coalescer() -> Optional[MessageCoalescer]:
+    """依 ECHO_COALESCE_WINDOW_MS 建立回聲合併器，未啟用時回傳 None。"""
+    window_ms = get_env_number("ECHO_COALESCE_WINDOW_MS", "0", int)
+    max_delay_ms = get_env_number("ECHO_COALESCE_MAX_DELAY_MS", "2000", int)
+    if window_ms <= 0:
+        return None
+    return MessageCoalescer(
+        _reply_coalesced,
+        window=window_ms / 1000,
+        max_delay=max(max_delay_ms, window_ms) / 1000,
+    )
+
+
+def ensure_admin(update: Update) -> None:
+    """確認指令發送者為管理員，否則拋出業務規則錯誤。"""
+    user = update.effective_user
+    if user is None or user.id not in get_admin_ids():
+        raise DomainRuleError(
+            message="此指令僅限管理員使用", hint="請聯繫 bot 管理員開通權限"
+        )
+
 
 @ErrorHandler.telegram_error_wrapper
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -52,25 +147,48 @@ async def time_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 @ErrorHandler.telegram_error_wrapper
 async def upper_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """處理 /upper 指令。把使用者輸入轉成全大寫回覆"""
-    if not context.args:
-        raise UserInputError(
-            message="缺少要轉換的文字參數", hint="使用方式：/upper <要轉換的文字>"
-        )
+    text = validate_transform_text(
+        " ".join(context.args or []), usage_hint="使用方式：/upper <要轉換的文字>"
+    )
 
-    text = " ".join(context.args)
+    await update.message.reply_text(transform_cache.apply("upper", text))
 
-    # 新增：業務規則驗證
-    if len(text) > 200:
-        raise DomainRuleError(
-            message="文字長度超過限制", hint="單次轉換文字不能超過 200 個字符"
-        )
 
-    if not text.strip():
-        raise UserInputError(
-            message="不能轉換空白文字", hint="請提供有內容的文字進行轉換"
-        )
+@ErrorHandler.telegram_error_wrapper
+async def inline_transform(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """處理 inline 查詢（@bot 文字），提供各種文字轉換結果。"""
+    query = update.inline_query
 
-    await update.message.reply_text(text.upper())
+    try:
+        text = validate_transform_text(
+            query.query, usage_hint="使用方式：@bot <要轉換的文字>"
+        )
+    except BaseAppError as e:
+        # inline 查詢沒有訊息可回覆：不提供可選取的結果（避免錯誤訊息被送進聊天室），
+        # 改以結果清單上方的按鈕顯示錯誤，再交給 telegram_error_wrapper 記錄
+        error_response = e.to_error_response()
+        await query.answer(
+            [],
+            cache_time=INLINE_CACHE_TIME,
+            button=InlineQueryResultsButton(
+                text=f"❌ {error_response.message} — {error_response.hint}",
+                start_parameter="inline",
+            ),
+        )
+        raise
+
+    results = []
+    for name in TRANSFORMS:
+        result = transform_cache.apply(name, text)
+        results.append(
+            InlineQueryResultArticle(
+                id=name,
+                title=TRANSFORM_TITLES[name],
+                description=result,
+                input_message_content=InputTextMessageContent(result),
+            )
+        )
+    await query.answer(results, cache_time=INLINE_CACHE_TIME)
 
 
 @ErrorHandler.telegram_error_wrapper
@@ -88,7 +206,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/ping - 測試 bot 是否在線\n"
         "/help - 顯示本指令清單\n"
         "/time - 回覆當下台北時間（格式：YYYY-MM-DD HH:MM:SS）\n"
-        "/upper <文字> - 把使用者輸入轉成全大寫回覆"
+        "/upper <文字> - 把使用者輸入轉成全大寫回覆\n"
+        "@bot <文字> - 在任何聊天室以 inline 方式轉換文字（大寫/小寫/首字大寫/反轉）"
     )
 
 
@@ -98,12 +217,236 @@ async def echo_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     if not update.message.text:
         raise UserInputError(message="無法處理空訊息", hint="請傳送文字訊息給我")
 
+    coalescer: Optional[MessageCoalescer] = context.bot_data.get("echo_coalescer")
+    if coalescer is not None:
+        coalescer.submit(update.effective_chat.id, update.message, update.message.text)
+        return
+
     await update.message.reply_text(update.message.text)
 
 
+def _parse_profile_seconds(args: list[str]) -> int:
+    """解析 /profile start 的秒數參數。"""
+    if not args:
+        return PROFILE_DEFAULT_SECONDS
+    if not args[0].isdigit():
+        raise UserInputError(
+            message="分析秒數必須是正整數", hint="使用方式：/profile start [秒數]"
+        )
+    seconds = int(args[0])
+    if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+        raise DomainRuleError(
+            message="分析秒數超出範圍",
+            hint=f"秒數需介於 1 到 {PROFILE_MAX_SECONDS} 之間",
+        )
+    return seconds
+
+
+async def _send_profile_report(bot: Bot, chat_id: int) -> bool:
+    """停止分析器並以檔案傳回報告；分析器已停止時回傳 False。"""
+    async with _profile_lock:
+        if not profiler.is_running:
+            return False
+        result = await asyncio.to_thread(profiler.stop)
+
+    collapsed = await asyncio.to_thread(result.to_collapsed)
+    summary = await asyncio.to_thread(result.to_pstats_summary)
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    await bot.send_document(
+        chat_id,
+        document=collapsed.encode("utf-8"),
+        filename=f"profile-{stamp}.collapsed.txt",
+        caption=f"📈 取樣 {result.samples} 次，時長 {result.duration:.1f} 秒",
+    )
+    await bot.send_document(
+        chat_id,
+        document=summary.encode("utf-8"),
+        filename=f"profile-{stamp}.pstats.txt",
+    )
+    return True
+
+
+async def _auto_stop_profile(bot: Bot, chat_id: int, seconds: int) -> None:
+    """時間到時自動停止分析並回傳報告。"""
+    global _profile_stop_task
+    await asyncio.sleep(seconds)
+    _profile_stop_task = None
+    await _send_profile_report(bot, chat_id)
+
+
+@ErrorHandler.telegram_error_wrapper
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """處理 /profile start|stop [秒數] 指令（限管理員）。"""
+    global _profile_stop_task
+    ensure_admin(update)
+
+    action = context.args[0].lower() if context.args else ""
+    chat_id = update.effective_chat.id
+
+    if action == "start":
+        seconds = _parse_profile_seconds(context.args[1:])
+        if profiler.is_running:
+            raise DomainRuleError(
+                message="效能分析已在執行中", hint="請先使用 /profile stop 停止"
+            )
+        profiler.start()
+        _profile_stop_task = context.application.create_task(
+            _auto_stop_profile(context.bot, chat_id, seconds)
+        )
+        await update.message.reply_text(
+            f"🔬 開始效能分析，{seconds} 秒後自動停止（或使用 /profile stop）"
+        )
+    elif action == "stop":
+        if _profile_stop_task is not None:
+            _profile_stop_task.cancel()
+            _profile_stop_task = None
+        if not await _send_profile_report(context.bot, chat_id):
+            raise DomainRuleError(
+                message="目前沒有執行中的效能分析", hint="請先使用 /profile start"
+            )
+    else:
+        raise UserInputError(
+            message="未知的 profile 動作", hint="使用方式：/profile start|stop [秒數]"
+        )
+
+
+@ErrorHandler.telegram_error_wrapper
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """處理 /stats 指令（限管理員）。回覆狀態持久化的快取與寫入統計。"""
+    ensure_admin(update)
+
+    persistence = context.application.persistence
+    if not isinstance(persistence, SQLitePersistence):
+        raise DomainRuleError(
+            message="尚未啟用狀態持久化", hint="請在 .env 設定 STATE_DB_PATH"
+        )
+
+    stats = persistence.stats
+    await update.message.reply_text(
+        "📊 狀態持久化統計\n"
+        f"快取筆數：{stats.cached}\n"
+        f"命中率：{stats.hit_rate:.1%}（{stats.hits} 命中 / {stats.misses} 未命中）\n"
+        f"淘汰次數：{stats.evictions}\n"
+        f"待寫入：{stats.dirty}\n"
+        f"寫入批次：{stats.flushes}（共 {stats.rows_written} 筆）\n"
+        f"寫入延遲：最近 {stats.last_flush_ms:.1f}ms / 平均 {stats.avg_flush_ms:.1f}ms"
+    )
+
+
+def get_broadcast_rate() -> float:
+    """讀取 BROADCAST_RATE（每秒發送則數），必須大於 0。"""
+    rate = get_env_number("BROADCAST_RATE", "25", float)
+    if not rate > 0:
+        raise UserInputError(
+            message="環境變數 BROADCAST_RATE 必須大於 0",
+            hint="請在 .env 檔案中把 BROADCAST_RATE 設為每秒發送則數，例如 25",
+        )
+    return rate
+
+
+def create_broadcast_engine(application: Application, rate: float) -> BroadcastEngine:
+    """建立廣播引擎，進度訊息會持續編輯同一則狀態訊息。"""
+    registry = ChatRegistry(os.path.join(BROADCAST_DATA_DIR, "chat_ids.bin"))
+    status_message_ids: dict[str, int] = {}
+
+    async def send(chat_id: int, text: str) -> None:
+        await application.bot.send_message(chat_id, text)
+
+    async def report(job: BroadcastJob, progress: BroadcastProgress) -> None:
+        text = progress.to_text()
+        message_id = status_message_ids.get(job.job_id)
+        if message_id is None:
+            message = await application.bot.send_message(job.report_chat_id, text)
+            status_message_ids[job.job_id] = message.message_id
+        else:
+            await application.bot.edit_message_text(
+                text, chat_id=job.report_chat_id, message_id=message_id
+            )
+
+    return BroadcastEngine(
+        registry,
+        send,
+        os.path.join(BROADCAST_DATA_DIR, "broadcast_checkpoint.json"),
+        rate=rate,
+        on_progress=report,
+    )
+
+
+async def record_chat(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """登記每個送來 update 的聊天室，作為廣播對象。"""
+    if update.effective_chat is not None:
+        context.bot_data["broadcast"].registry.add(update.effective_chat.id)
+
+
+@ErrorHandler.telegram_error_wrapper
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """處理 /broadcast <訊息>|status|cancel 指令（限管理員）。"""
+    ensure_admin(update)
+    engine: BroadcastEngine = context.bot_data["broadcast"]
+
+    if not context.args:
+        raise UserInputError(
+            message="缺少廣播內容",
+            hint="使用方式：/broadcast <訊息>、/broadcast status、/broadcast cancel",
+        )
+
+    action = context.args[0].lower() if len(context.args) == 1 else ""
+
+    if action == "status":
+        progress = engine.progress()
+        if progress is None:
+            raise DomainRuleError(
+                message="目前沒有廣播紀錄", hint="使用 /broadcast <訊息> 開始廣播"
+            )
+        state = "進行中" if engine.is_running else "已結束"
+        await update.message.reply_text(f"{progress.to_text()}\n狀態：{state}")
+    elif action == "cancel":
+        if not engine.is_running:
+            raise DomainRuleError(
+                message="目前沒有進行中的廣播", hint="使用 /broadcast status 查看紀錄"
+            )
+        await engine.cancel()
+        await update.message.reply_text("🛑 已取消廣播")
+    else:
+        # 保留原始訊息的換行，只去掉指令本身
+        text = update.message.text.split(maxsplit=1)[1]
+        if telegram_length(text) > TELEGRAM_MESSAGE_LIMIT:
+            raise DomainRuleError(
+                message="廣播內容超過長度限制",
+                hint=f"單則訊息不能超過 {TELEGRAM_MESSAGE_LIMIT} 個字元",
+            )
+        if engine.is_running:
+            raise DomainRuleError(
+                message="已有廣播正在進行", hint="請等待完成或使用 /broadcast cancel"
+            )
+        job = engine.start(text, update.effective_chat.id)
+        await update.message.reply_text(
+            f"📣 開始廣播給 {job.total} 個聊天室（任務 {job.job_id}）"
+        )
+
+
 # 新增：啟動時自動把指令清單註冊到 Telegram 選單
 async def post_init(app: Application) -> None:
     """啟動時自動把指令清單註冊到 Telegram 選單"""
+    # 讓 /profile 能把背景執行緒的取樣歸到發起的 handler
+    install_thread_attribution(asyncio.get_running_loop())
+
+    coalescer: Optional[MessageCoalescer] = app.bot_data.get("echo_coalescer")
+    if coalescer is not None:
+        coalescer.start()
+
+    # 讓持久化淘汰資料時能從 Application 移除該 ID
+    if isinstance(app.persistence, SQLitePersistence):
+        app.persistence.attach(app)
+
+    # 接續上次中斷的廣播
+    job = app.bot_data["broadcast"].resume()
+    if job is not None:
+        logging.getLogger(__name__).info(
+            f"Resuming broadcast {job.job_id} at {job.offset}/{job.total}"
+        )
+
     try:
         await app.bot.set_my_commands(
             [
@@ -120,6 +463,22 @@ async def post_init(app: Application) -> None:
         ) from e
 
 
+async def post_stop(app: Application) -> None:
+    """停止接收 update 後、bot 連線關閉前，送出所有尚未送出的合併回覆並暫停廣播"""
+    coalescer: Optional[MessageCoalescer] = app.bot_data.get("echo_coalescer")
+    if coalescer is not None:
+        await coalescer.close()
+
+    # 趁連線仍可用時停止，檢查點停在最後一批成功送出的位置，供下次啟動 resume
+    await app.bot_data["broadcast"].stop()
+
+
+async def post_shutdown(app: Application) -> None:
+    """關閉聊天室登記檔"""
+    engine: BroadcastEngine = app.bot_data["broadcast"]
+    engine.registry.close()
+
+
 @main_error_handler
 def main() -> None:
     """啟動 bot。"""
@@ -129,10 +488,32 @@ def main() -> None:
             message="缺少 Telegram Bot Token",
             hint="請在 .env 檔案中設定 TELEGRAM_BOT_TOKEN",
         )
+    echo_coalescer = create_echo_coalescer()
+    broadcast_rate = get_broadcast_rate()
 
     try:
         # 加入 post_init
-        application = Application.builder().token(token).post_init(post_init).build()
+        builder = (
+            Application.builder()
+            .token(token)
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .post_shutdown(post_shutdown)
+        )
+
+        # 設定 STATE_DB_PATH 時啟用 SQLite 狀態持久化
+        state_db_path = os.getenv("STATE_DB_PATH")
+        if state_db_path:
+            builder = builder.persistence(SQLitePersistence(state_db_path))
+
+        application = builder.build()
+        application.bot_data["echo_coalescer"] = echo_coalescer
+        application.bot_data["broadcast"] = create_broadcast_engine(
+            application, broadcast_rate
+        )
+
+        # 最先執行：登記所有聊天室 ID 供廣播使用
+        application.add_handler(TypeHandler(Update, record_chat), group=-1)
 
         # 註冊指令處理器
         application.add_handler(CommandHandler("start", start_command))
@@ -140,6 +521,11 @@ def main() -> None:
         application.add_handler(CommandHandler("help", help_command))
         application.add_handler(CommandHandler("time", time_command))
         application.add_handler(CommandHandler("upper", upper_command))
+        application.add_handler(CommandHandler("profile", profile_command))
+        application.add_handler(CommandHandler("stats", stats_command))
+        application.add_handler(CommandHandler("broadcast", broadcast_command))
+
+        application.add_handler(InlineQueryHandler(inline_transform))
 
         # 註冊訊息處理器，處理所有非指令的文字訊息
         application.add_handler(
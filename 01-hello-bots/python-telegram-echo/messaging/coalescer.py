@@ -0,0 +1,238 @@
+"""
+訊息合併（debounce）模組
+把同一聊天室短時間內連續送達的訊息合併成一則回覆，減少對外 API 呼叫
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Telegram 單則訊息文字上限
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+SendCallback = Callable[[Any, str], Awaitable[Any]]
+
+
+@dataclass
+class _PendingReply:
+    """單一聊天室等待送出的合併內容"""
+
+    target: Any
+    first_at: float
+    deadline: float
+    parts: List[str] = field(default_factory=list)
+    length: int = 0
+
+
+def telegram_length(text: str) -> int:
+    """以 Telegram 的計算方式（UTF-16 code unit）計算文字長度"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _fit(text: str, limit: int) -> int:
+    """回傳 text 開頭最多幾個字元的 UTF-16 長度不超過 limit（不拆開代理對）"""
+    units = 0
+    for index, char in enumerate(text):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > limit:
+            return index
+    return len(text)
+
+
+def split_for_telegram(
+    parts: List[str], separator: str = "\n", limit: int = TELEGRAM_MESSAGE_LIMIT
+) -> List[str]:
+    """
+    把多段文字以 separator 串接，並切成不超過 limit 的多則訊息
+
+    長度以 telegram_length 計算，與 Telegram 的限制一致（emoji 等字元算 2）。
+
+    Args:
+        parts: 依序排列的文字片段
+        separator: 片段之間的分隔字串
+        limit: 單則訊息長度上限
+
+    Returns:
+        List[str]: 每則長度皆不超過 limit 的訊息
+    """
+    chunks: List[str] = []
+    current = ""
+    current_length = 0
+    separator_length = telegram_length(separator)
+    for part in parts:
+        length = telegram_length(part)
+        # 單一片段本身就過長時直接硬切
+        while length > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            cut = _fit(part, limit)
+            chunks.append(part[:cut])
+            part = part[cut:]
+            length = telegram_length(part)
+        if not current:
+            current, current_length = part, length
+        elif current_length + separator_length + length <= limit:
+            current = f"{current}{separator}{part}"
+            current_length += separator_length + length
+        else:
+            chunks.append(current)
+            current, current_length = part, length
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class MessageCoalescer:
+    """
+    每個聊天室一個 debounce 視窗的訊息合併器
+
+    所有聊天室共用一個最小堆積（以截止時間排序）與單一背景任務，
+    不會為每個聊天室各自建立 asyncio task，聊天室數量再多也只有一個計時器。
+    每則新訊息會把截止時間往後延 window 秒，但不超過第一則訊息後 max_delay 秒。
+    到期的內容交給短暫的發送任務送出，排程迴圈不等待網路回應；
+    同一聊天室的發送任務會依序串接，確保回覆順序不變。
+    """
+
+    def __init__(
+        self,
+        send: SendCallback,
+        window: float = 0.5,
+        max_delay: float = 2.0,
+        separator: str = "\n",
+        limit: int = TELEGRAM_MESSAGE_LIMIT,
+    ):
+        if window <= 0 or max_delay < window:
+            raise ValueError("window must be positive and not exceed max_delay")
+        self.send = send
+        self.window = window
+        self.max_delay = max_delay
+        self.separator = separator
+        self.limit = limit
+        self._pending: Dict[int, _PendingReply] = {}
+        self._heap: List[Tuple[float, int, int]] = []
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        # 每個聊天室最後一個尚未完成的發送任務
+        self._inflight: Dict[int, asyncio.Task] = {}
+
+    @property
+    def pending_chats(self) -> int:
+        """目前有待送內容的聊天室數量"""
+        return len(self._pending)
+
+    def start(self) -> None:
+        """啟動背景排程任務（可重複呼叫）"""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run(), name="message-coalescer")
+
+    async def close(self) -> None:
+        """停止背景任務並送出所有尚未送出的內容"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._dispatch(list(self._pending))
+        await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+
+    def submit(self, chat_id: int, target: Any, text: str) -> None:
+        """
+        加入一則待合併訊息
+
+        Args:
+            chat_id: 聊天室 ID，作為合併的分組依據
+            target: 傳給 send 回呼的對象（通常是最新一則 Message）
+            text: 訊息文字
+        """
+        now = time.monotonic()
+        pending = self._pending.get(chat_id)
+        if pending is None:
+            pending = _PendingReply(target=target, first_at=now, deadline=now)
+            self._pending[chat_id] = pending
+        pending.target = target
+        pending.parts.append(text)
+        pending.length += telegram_length(text) + telegram_length(self.separator)
+
+        if pending.length >= self.limit:
+            # 已經湊滿一則訊息，不必再等
+            pending.deadline = now
+        else:
+            pending.deadline = min(now + self.window, pending.first_at + self.max_delay)
+
+        self._seq += 1
+        heapq.heappush(self._heap, (pending.deadline, self._seq, chat_id))
+        self._wakeup.set()
+        self.start()
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            timeout = self._heap[0][0] - time.monotonic()
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._dispatch(self._pop_due())
+
+    def _pop_due(self) -> List[int]:
+        now = time.monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, chat_id = heapq.heappop(self._heap)
+            pending = self._pending.get(chat_id)
+            # 截止時間已被後續訊息延後的舊項目直接略過
+            if pending is not None and pending.deadline == deadline:
+                due.append(chat_id)
+        return due
+
+    def _dispatch(self, chat_ids: List[int]) -> None:
+        for chat_id in chat_ids:
+            pending = self._pending.pop(chat_id, None)
+            if pending is None:
+                continue
+            previous = self._inflight.get(chat_id)
+            task = asyncio.create_task(self._flush_one(chat_id, pending, previous))
+            self._inflight[chat_id] = task
+            task.add_done_callback(
+                lambda done, chat_id=chat_id: self._forget_inflight(chat_id, done)
+            )
+
+    def _forget_inflight(self, chat_id: int, task: asyncio.Task) -> None:
+        if self._inflight.get(chat_id) is task:
+            del self._inflight[chat_id]
+
+    async def _flush_one(
+        self,
+        chat_id: int,
+        pending: _PendingReply,
+        previous: Optional[asyncio.Task],
+    ) -> None:
+        if previous is not None:
+            # 等同一聊天室前一批送完，維持回覆順序
+            await asyncio.wait([previous])
+        for chunk in split_for_telegram(pending.parts, self.separator, self.limit):
+            try:
+                await self.send(pending.target, chunk)
+            except Exception:
+                # 只放棄失敗的這一則，其餘片段照常送出
+                logger.error(
+                    "Coalesced reply failed",
+                    exc_info=True,
+                    extra={"chat_id": chat_id},
+                )
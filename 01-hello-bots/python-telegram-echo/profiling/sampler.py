@@ -0,0 +1,282 @@
+"""
+取樣式效能分析器模組
+以背景執行緒定期擷取所有執行緒（含 event loop）的呼叫堆疊，
+輸出 flamegraph 相容的 collapsed-stack 與 pstats 摘要
+"""
+
+import asyncio
+import inspect
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# 函式識別鍵，與 pstats 相同格式：(檔名, 起始行號, 函式名稱)
+FuncKey = Tuple[str, int, str]
+# 堆疊鍵：(執行緒名稱, handler 名稱, 由外而內的函式序列)
+StackKey = Tuple[str, str, Tuple[FuncKey, ...]]
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 這些目錄內的協程是包裝器或分析器本身，不視為 handler
+_NON_HANDLER_DIRS = tuple(
+    os.path.join(PROJECT_ROOT, name) + os.sep for name in ("errors", "profiling")
+)
+NO_HANDLER = "<no-handler>"
+
+# 背景執行緒 ident -> 發起該工作的 handler（由 AttributingExecutor 登記）
+_thread_handlers: Dict[int, str] = {}
+# 執行中的分析器數量；為 0 時 AttributingExecutor 不做任何額外工作
+_active_profilers = 0
+
+
+@dataclass
+class ProfileResult:
+    """單次分析結果"""
+
+    interval: float
+    duration: float
+    samples: int
+    dropped: int
+    stacks: Dict[StackKey, int] = field(default_factory=dict)
+
+    def to_collapsed(self) -> str:
+        """轉換為 collapsed-stack 格式（flamegraph.pl / speedscope 可直接讀取）"""
+        lines = []
+        for (thread_name, handler, frames), count in sorted(
+            self.stacks.items(), key=lambda item: -item[1]
+        ):
+            names = [thread_name, handler] + [_format_frame(f) for f in frames]
+            lines.append(f"{';'.join(names)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def handler_totals(self) -> Counter:
+        """依 handler 彙總取樣數"""
+        totals: Counter = Counter()
+        for (_, handler, _), count in self.stacks.items():
+            totals[handler] += count
+        return totals
+
+    def to_pstats_summary(self, limit: int = 40) -> str:
+        """轉換為 pstats 文字摘要"""
+        stream = io.StringIO()
+        stream.write(
+            f"取樣數: {self.samples}  丟棄: {self.dropped}  "
+            f"間隔: {self.interval * 1000:.1f}ms  時長: {self.duration:.1f}s\n\n"
+        )
+        stream.write("各 handler 取樣分布:\n")
+        for label, count in self.handler_totals().most_common():
+            share = count / self.samples * 100 if self.samples else 0.0
+            stream.write(f"  {share:6.2f}%  {count:8d}  {label}\n")
+        stream.write("\n")
+
+        if self.stacks:
+            stats = pstats.Stats(_SampledStats(self), stream=stream)
+            stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+
+class _SampledStats:
+    """將取樣結果轉為 pstats.Stats 可載入的物件（實作 create_stats 介面）"""
+
+    def __init__(self, result: ProfileResult):
+        self._result = result
+        self.stats: dict = {}
+
+    def create_stats(self) -> None:
+        interval = self._result.interval
+        # func -> [nc, cc, tt, ct, callers]
+        table: Dict[FuncKey, list] = {}
+        for (_, _, frames), count in self._result.stacks.items():
+            seconds = count * interval
+            seen = set()
+            for depth, func in enumerate(frames):
+                entry = table.setdefault(func, [0, 0, 0.0, 0.0, {}])
+                # 遞迴呼叫只計一次累計時間
+                if func not in seen:
+                    seen.add(func)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if depth > 0:
+                    caller = frames[depth - 1]
+                    nc, cc, tt, ct = entry[4].get(caller, (0, 0, 0.0, 0.0))
+                    entry[4][caller] = (nc + count, cc + count, tt, ct + seconds)
+            table[frames[-1]][2] += seconds
+
+        self.stats = {
+            func: (nc, cc, tt, ct, callers)
+            for func, (nc, cc, tt, ct, callers) in table.items()
+        }
+
+
+class SamplingProfiler:
+    """
+    低負擔取樣分析器
+
+    停止時不安裝任何 hook、不存在背景執行緒，因此關閉時沒有額外負擔。
+    相異堆疊數量上限為 max_stacks，超出的新堆疊只計入 dropped，
+    確保收集器記憶體有硬上限。
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.01,
+        max_stacks: int = 10_000,
+        max_depth: int = 64,
+    ):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._dropped = 0
+        self._started_at = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        """分析器是否正在取樣"""
+        return self._thread is not None
+
+    def start(self) -> None:
+        """開始取樣"""
+        with self._lock:
+            if self._thread is not None:
+                raise RuntimeError("profiler is already running")
+            self._stacks = Counter()
+            self._samples = 0
+            self._dropped = 0
+            self._stop_event.clear()
+            _set_active(+1)
+            self._started_at = time.perf_counter()
+            self._thread = threading.Thread(
+                target=self._run, name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> ProfileResult:
+        """停止取樣並回傳結果"""
+        with self._lock:
+            if self._thread is None:
+                raise RuntimeError("profiler is not running")
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+            _set_active(-1)
+            result = ProfileResult(
+                interval=self.interval,
+                duration=time.perf_counter() - self._started_at,
+                samples=self._samples,
+                dropped=self._dropped,
+                stacks=dict(self._stacks),
+            )
+            self._stacks = Counter()
+            return result
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            self._sample(own_ident)
+
+    def _sample(self, own_ident: int) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            frames = []
+            handler = NO_HANDLER
+            while frame is not None and len(frames) < self.max_depth:
+                code = frame.f_code
+                frames.append((code.co_filename, code.co_firstlineno, code.co_name))
+                # 由內往外走，最後命中的即最外層的專案協程（也就是 handler）
+                if code.co_flags & inspect.CO_COROUTINE and _is_handler_file(
+                    code.co_filename
+                ):
+                    handler = code.co_name
+                frame = frame.f_back
+            if not frames:
+                continue
+            frames.reverse()
+            if handler == NO_HANDLER:
+                handler = _thread_handlers.get(ident, NO_HANDLER)
+            key = (names.get(ident, f"thread-{ident}"), handler, tuple(frames))
+
+            self._samples += 1
+            if key in self._stacks or len(self._stacks) < self.max_stacks:
+                self._stacks[key] += 1
+            else:
+                self._dropped += 1
+
+
+class AttributingExecutor(ThreadPoolExecutor):
+    """
+    記錄發起端 handler 的執行緒池
+
+    由 install_thread_attribution 設為 event loop 的預設 executor，
+    因此 asyncio.to_thread 與 run_in_executor(None, ...) 都會經過這裡。
+    分析器執行中時，把提交工作的 handler 登記給執行該工作的執行緒，
+    讓執行緒上的取樣也能歸到對應 handler；分析器關閉時等同一般的 ThreadPoolExecutor。
+    """
+
+    def submit(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> Future:
+        if not _active_profilers:
+            return super().submit(fn, *args, **kwargs)
+
+        handler = _handler_for_frame(sys._getframe(1))
+
+        def run() -> T:
+            ident = threading.get_ident()
+            _thread_handlers[ident] = handler
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _thread_handlers.pop(ident, None)
+
+        return super().submit(run)
+
+
+def install_thread_attribution(loop: asyncio.AbstractEventLoop) -> None:
+    """把 AttributingExecutor 設為 loop 的預設 executor（需在 loop 執行中呼叫一次）"""
+    loop.set_default_executor(AttributingExecutor(thread_name_prefix="asyncio"))
+
+
+def _set_active(delta: int) -> None:
+    global _active_profilers
+    _active_profilers += delta
+
+
+def _handler_for_frame(frame) -> str:
+    """由內往外找出最外層的專案協程名稱"""
+    handler = NO_HANDLER
+    while frame is not None:
+        code = frame.f_code
+        if code.co_flags & inspect.CO_COROUTINE and _is_handler_file(code.co_filename):
+            handler = code.co_name
+        frame = frame.f_back
+    return handler
+
+
+def _format_frame(frame: FuncKey) -> str:
+    filename, lineno, name = frame
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+@lru_cache(maxsize=1024)
+def _is_handler_file(filename: str) -> bool:
+    path = os.path.abspath(filename)
+    return (
+        path.startswith(PROJECT_ROOT)
+        and not path.startswith(_NON_HANDLER_DIRS)
+        and "site-packages" not in path
+    )
@@ -0,0 +1,117 @@
+"""
+LRU + TTL 快取模組
+容量有上限、項目有存活時間的記憶體快取，並統計命中率
+"""
+
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[K, V]):
+    """
+    容量有上限的 LRU 快取，每個項目自寫入起 ttl 秒後過期
+
+    超出容量時淘汰最久未使用的項目；過期項目在讀取或 purge_expired 時移除。
+    兩種情況都會呼叫 on_evict(key, value)，讓呼叫端有機會先保存資料。
+    sliding=True 時每次命中都會重設存活時間（閒置逾時），否則自寫入起計算。
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        on_evict: Optional[Callable[[K, V], None]] = None,
+        sliding: bool = False,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        if maxsize <= 0 or ttl <= 0:
+            raise ValueError("maxsize and ttl must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.sliding = sliding
+        self._timer = timer
+        self._data: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        item = self._data.get(key)
+        return item is not None and item[0] > self._timer()
+
+    @property
+    def hit_rate(self) -> float:
+        """命中率（0.0 ~ 1.0），尚無查詢時為 0.0"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """取得項目並標記為最近使用；不存在或已過期時回傳 default"""
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = item
+        now = self._timer()
+        if expires_at <= now:
+            self._evict(key)
+            self.misses += 1
+            return default
+
+        if self.sliding:
+            self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        """寫入項目並重設存活時間，超出容量時淘汰最久未使用的項目"""
+        self._data[key] = (self._timer() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._evict(next(iter(self._data)))
+
+    def peek(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """取得項目但不影響 LRU 順序、存活時間與命中統計（含已過期未移除的項目）"""
+        item = self._data.get(key)
+        return default if item is None else item[1]
+
+    def items(self) -> List[Tuple[K, V]]:
+        """列出所有項目（不影響 LRU 順序與命中統計）"""
+        return [(key, value) for key, (_, value) in self._data.items()]
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """移除項目但不觸發 on_evict"""
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def purge_expired(self) -> int:
+        """移除所有已過期項目，回傳移除數量"""
+        now = self._timer()
+        expired = [
+            key for key, (expires_at, _) in self._data.items() if expires_at <= now
+        ]
+        for key in expired:
+            self._evict(key)
+        return len(expired)
+
+    def clear(self) -> None:
+        """清空快取但不觸發 on_evict"""
+        self._data.clear()
+
+    def _evict(self, key: K) -> None:
+        _, value = self._data.pop(key)
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
@@ -0,0 +1,355 @@
+"""
+SQLite 持久化模組
+熱資料放在容量有上限的 LRU + TTL 快取，變更以批次 write-behind 寫入 SQLite（WAL）
+"""
+
+import asyncio
+import hashlib
+import logging
+import pickle
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import Application, BasePersistence, PersistenceInput
+
+from errors.exceptions import SystemError
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+USER = "user"
+CHAT = "chat"
+
+# 快取鍵：(資料種類, user_id 或 chat_id)
+StateKey = Tuple[str, int]
+
+
+@dataclass
+class _CachedState:
+    """快取中的狀態：Application 持有的同一個 dict，以及最後一次落盤時的摘要"""
+
+    data: Dict[Any, Any]
+    digest: bytes
+
+
+@dataclass
+class PersistenceStats:
+    """持久化統計資訊"""
+
+    cached: int
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+    dirty: int
+    flushes: int
+    rows_written: int
+    last_flush_ms: float
+    avg_flush_ms: float
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    以 SQLite 為後端的 Application 持久化
+
+    - 啟動時不載入任何 user_data / chat_data，第一次被 handler 存取時
+      （refresh_user_data / refresh_chat_data）才從資料庫讀取
+    - 熱資料保存在 TTLCache；被淘汰時若有變更先轉成待寫入快照，
+      再把該 ID 從 Application 的 user_data / chat_data 移除（需先呼叫 attach），
+      讓常駐記憶體的 ID 數量維持在 max_entries 內；未 attach 時只能清空 dict，
+      每個出現過的 ID 仍會在 Application 留下一個空 dict
+    - 使用 concurrent_updates 時，max_entries 需大於同時處理中的 ID 數量，
+      否則處理中的 dict 可能被淘汰，之後的修改不會保存
+    - update_user_data / update_chat_data 收到的是 Application 的 deepcopy，
+      只拿來產生待寫入快照，快取中仍保留 refresh 時拿到的原始 dict
+    - 變更累積到 batch_size 筆或距上次寫入超過 flush_interval 秒時，
+      在背景執行緒以單一交易批次寫入
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = 10_000,
+        ttl: float = 3600,
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        update_interval: float = 60,
+    ):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._cache: TTLCache[StateKey, _CachedState] = TTLCache(
+            maxsize=max_entries, ttl=ttl, on_evict=self._on_evict, sliding=True
+        )
+        # 待寫入：鍵 -> pickle 後的資料；None 代表刪除
+        self._dirty: Dict[StateKey, Optional[bytes]] = {}
+        # 保護資料庫連線與「取出待寫入 → 寫入」整段流程，避免批次交錯
+        self._db_lock = asyncio.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Application 內 user_data / chat_data 的底層 dict，由 attach 設定
+        self._app_mappings: Dict[str, Dict[int, Dict[Any, Any]]] = {}
+        self._last_flush_at = time.monotonic()
+        self._flushes = 0
+        self._rows_written = 0
+        self._flush_ms_total = 0.0
+        self._last_flush_ms = 0.0
+
+    def attach(self, application: Application) -> None:
+        """
+        取得 Application 的 user_data / chat_data 對應表，淘汰時直接移除該 ID
+
+        Application 只公開唯讀的 MappingProxyType，而 drop_user_data / drop_chat_data
+        會連帶刪除資料庫內的資料，因此這裡直接持有底層的 dict。
+        """
+        self._app_mappings = {
+            USER: application._user_data,
+            CHAT: application._chat_data,
+        }
+
+    # ---- 統計 ----
+
+    @property
+    def stats(self) -> PersistenceStats:
+        """目前的快取與寫入統計"""
+        return PersistenceStats(
+            cached=len(self._cache),
+            hits=self._cache.hits,
+            misses=self._cache.misses,
+            hit_rate=self._cache.hit_rate,
+            evictions=self._cache.evictions,
+            dirty=len(self._dirty),
+            flushes=self._flushes,
+            rows_written=self._rows_written,
+            last_flush_ms=self._last_flush_ms,
+            avg_flush_ms=(
+                self._flush_ms_total / self._flushes if self._flushes else 0.0
+            ),
+        )
+
+    # ---- 啟動時載入：全部延遲到第一次存取 ----
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    # ---- handler 執行前：延遲載入 ----
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        await self._ensure_loaded((USER, user_id), user_data)
+        await self._maybe_flush()
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        await self._ensure_loaded((CHAT, chat_id), chat_data)
+        await self._maybe_flush()
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        pass
+
+    # ---- handler 執行後：標記變更 ----
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        await self._mark_updated((USER, user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        await self._mark_updated((CHAT, chat_id), data)
+
+    async def update_bot_data(self, data: Dict) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Any) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._drop((USER, user_id))
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._drop((CHAT, chat_id))
+
+    async def flush(self) -> None:
+        """關閉前寫入所有變更（含快取中尚未標記的修改）並關閉資料庫"""
+        for key, state in self._cache.items():
+            self._snapshot_if_changed(key, state)
+        await self.flush_dirty()
+        async with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---- write-behind ----
+
+    async def flush_dirty(self) -> None:
+        """把目前累積的變更以單一交易寫入 SQLite"""
+        async with self._db_lock:
+            self._cache.purge_expired()
+            if not self._dirty:
+                return
+
+            batch, self._dirty = self._dirty, {}
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                # 寫入失敗時放回待寫入佇列，但不覆蓋期間產生的新變更
+                for key, value in batch.items():
+                    self._dirty.setdefault(key, value)
+                raise SystemError(
+                    message="狀態資料寫入失敗", hint="請檢查資料庫檔案權限與磁碟空間"
+                ) from e
+            finally:
+                self._last_flush_at = time.monotonic()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._flushes += 1
+        self._rows_written += len(batch)
+        self._last_flush_ms = elapsed_ms
+        self._flush_ms_total += elapsed_ms
+        logger.debug(
+            "State flushed",
+            extra={"rows": len(batch), "flush_ms": round(elapsed_ms, 2)},
+        )
+
+    async def _maybe_flush(self) -> None:
+        if not self._dirty:
+            return
+        overdue = time.monotonic() - self._last_flush_at >= self.flush_interval
+        if len(self._dirty) >= self.batch_size or overdue:
+            try:
+                await self.flush_dirty()
+            except SystemError as e:
+                # 背景寫入失敗不影響目前的 handler，變更留待下次重試
+                logger.error(
+                    f"Write-behind flush failed: {e.message}",
+                    exc_info=True,
+                    extra={"correlation_id": e.correlation_id},
+                )
+
+    # ---- 內部工具 ----
+
+    async def _ensure_loaded(self, key: StateKey, data: Dict) -> _CachedState:
+        state = self._cache.get(key)
+        if state is not None and state.data is data:
+            return state
+
+        stored = await self._load(key)
+        # 淘汰後才寫入的新值優先，資料庫內的舊值墊在下面
+        for field_name, value in stored.items():
+            data.setdefault(field_name, value)
+        state = _CachedState(data=data, digest=_serialize(stored)[1])
+        self._cache.set(key, state)
+        return state
+
+    async def _mark_updated(self, key: StateKey, data: Dict) -> None:
+        state = self._cache.peek(key)
+        if state is not None:
+            # data 是 deepcopy：只更新快照，不取代快取中的原始 dict
+            payload, digest = _serialize(data)
+            if digest != state.digest:
+                self._dirty[key] = payload
+                state.digest = digest
+        else:
+            # 不在快取中代表已被淘汰：淘汰時的快照才是最新內容，這份 copy 不可寫回。
+            # Application 產生 copy 時會以 defaultdict 重建一個空項目，一併移除
+            mapping = self._app_mappings.get(key[0])
+            entry = None if mapping is None else mapping.get(key[1])
+            if entry is not None and not entry:
+                del mapping[key[1]]
+        await self._maybe_flush()
+
+    async def _drop(self, key: StateKey) -> None:
+        self._cache.pop(key)
+        self._dirty[key] = None
+        await self._maybe_flush()
+
+    def _snapshot_if_changed(self, key: StateKey, state: _CachedState) -> None:
+        payload, digest = _serialize(state.data)
+        if digest != state.digest:
+            self._dirty[key] = payload
+            state.digest = digest
+
+    def _on_evict(self, key: StateKey, state: _CachedState) -> None:
+        self._snapshot_if_changed(key, state)
+        # 資料已保存（或待寫入），釋放 Application 端的記憶體，下次存取再載入
+        kind, state_id = key
+        mapping = self._app_mappings.get(kind)
+        if mapping is not None and mapping.get(state_id) is state.data:
+            del mapping[state_id]
+        else:
+            state.data.clear()
+
+    async def _load(self, key: StateKey) -> Dict:
+        # 持有鎖時不會有進行中的寫入，待寫入資料只可能在 _dirty 或資料庫裡
+        async with self._db_lock:
+            if key in self._dirty:
+                payload = self._dirty[key]
+            else:
+                payload = await asyncio.to_thread(self._read_row, key)
+        return {} if payload is None else pickle.loads(payload)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                " kind TEXT NOT NULL,"
+                " id INTEGER NOT NULL,"
+                " data BLOB NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (kind, id)"
+                ") WITHOUT ROWID"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _read_row(self, key: StateKey) -> Optional[bytes]:
+        row = (
+            self._connect()
+            .execute("SELECT data FROM state WHERE kind = ? AND id = ?", key)
+            .fetchone()
+        )
+        return None if row is None else row[0]
+
+    def _write_batch(self, batch: Dict[StateKey, Optional[bytes]]) -> None:
+        now = time.time()
+        upserts = [
+            (kind, state_id, payload, now)
+            for (kind, state_id), payload in batch.items()
+            if payload is not None
+        ]
+        deletes = [key for key, payload in batch.items() if payload is None]
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO state (kind, id, data, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (kind, id) DO UPDATE SET"
+                " data = excluded.data, updated_at = excluded.updated_at",
+                upserts,
+            )
+            conn.executemany("DELETE FROM state WHERE kind = ? AND id = ?", deletes)
+
+
+def _serialize(data: Dict) -> Tuple[bytes, bytes]:
+    """序列化資料，回傳 (payload, 摘要)"""
+    payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    return payload, hashlib.blake2b(payload, digest_size=16).digest()
@@ -0,0 +1,273 @@
+"""
+廣播功能單元測試
+驗證聊天室登記、速率控制、封鎖處理與檢查點續傳
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import pytest
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter
+
+from broadcast.chat_registry import ChatRegistry
+from broadcast.engine import BroadcastEngine, BroadcastJob, RateLimiter
+
+
+class FakeSender:
+    """記錄送出對象，並可針對特定聊天室拋出錯誤的假 send 回呼"""
+
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = dict(errors or {})
+
+    async def __call__(self, chat_id, text):
+        error = self.errors.pop(chat_id, None)
+        if error is not None:
+            raise error
+        self.sent.append(chat_id)
+
+
+def make_registry(tmp_path, chat_ids) -> ChatRegistry:
+    """建立已登記指定聊天室的 registry"""
+    registry = ChatRegistry(str(tmp_path / "chat_ids.bin"))
+    for chat_id in chat_ids:
+        registry.add(chat_id)
+    return registry
+
+
+async def wait_for_engine(engine: BroadcastEngine) -> None:
+    """等待廣播結束"""
+    while engine.is_running:
+        await asyncio.sleep(0.01)
+
+
+class TestChatRegistry:
+    """測試 ChatRegistry"""
+
+    def test_add_deduplicates(self, tmp_path):
+        """測試重複的 ID 只登記一次"""
+        registry = make_registry(tmp_path, [])
+
+        assert registry.add(1) is True
+        assert registry.add(1) is False
+        assert registry.add(-100123) is True
+        assert len(registry) == 2
+        assert os.path.getsize(registry.path) == 16
+
+    def test_reload_from_disk(self, tmp_path):
+        """測試重新開啟後保留已登記的 ID"""
+        make_registry(tmp_path, [1, 2, 3]).close()
+        registry = ChatRegistry(str(tmp_path / "chat_ids.bin"))
+
+        assert len(registry) == 3
+        assert 2 in registry
+
+    def test_read_batch_by_offset(self, tmp_path):
+        """測試依 offset 分批讀取"""
+        registry = make_registry(tmp_path, [10, 20, 30, 40, 50])
+
+        assert registry.read_batch(0, 2) == [10, 20]
+        assert registry.read_batch(3, 10) == [40, 50]
+        assert registry.read_batch(5, 10) == []
+
+    def test_truncates_partial_record(self, tmp_path):
+        """測試截掉當機留下的不完整紀錄"""
+        make_registry(tmp_path, [1, 2]).close()
+        path = tmp_path / "chat_ids.bin"
+        with open(path, "ab") as f:
+            f.write(b"\x01\x02\x03")
+
+        registry = ChatRegistry(str(path))
+        assert len(registry) == 2
+        assert os.path.getsize(path) == 16
+
+    def test_retire_and_restore(self, tmp_path):
+        """測試退役紀錄會保存，且聊天室再次互動時恢復"""
+        registry = make_registry(tmp_path, [1, 2])
+        registry.retire(1)
+        registry.close()
+
+        registry = ChatRegistry(str(tmp_path / "chat_ids.bin"))
+        assert registry.is_retired(1)
+        assert not registry.is_retired(2)
+
+        assert registry.add(1) is False
+        registry.close()
+        assert not ChatRegistry(str(tmp_path / "chat_ids.bin")).is_retired(1)
+
+
+class TestRateLimiter:
+    """測試 RateLimiter"""
+
+    @pytest.mark.asyncio
+    async def test_paces_to_rate(self):
+        """測試發送間隔符合設定速率"""
+        limiter = RateLimiter(rate=100)
+        started = time.monotonic()
+        for _ in range(11):
+            await limiter.acquire()
+
+        assert time.monotonic() - started >= 0.09
+
+    def test_invalid_rate(self):
+        """測試速率必須為正數"""
+        with pytest.raises(ValueError):
+            RateLimiter(rate=0)
+
+
+class TestBroadcastEngine:
+    """測試 BroadcastEngine"""
+
+    @pytest.mark.asyncio
+    async def test_sends_to_all_chats(self, tmp_path):
+        """測試送給所有聊天室並在完成後刪除檢查點"""
+        registry = make_registry(tmp_path, range(1, 8))
+        sender = FakeSender()
+        checkpoint = str(tmp_path / "checkpoint.json")
+        engine = BroadcastEngine(registry, sender, checkpoint, rate=1000, batch_size=3)
+
+        job = engine.start("hello", report_chat_id=99)
+        await wait_for_engine(engine)
+
+        assert sorted(sender.sent) == list(range(1, 8))
+        assert job.sent == 7
+        assert job.offset == job.total == 7
+        assert not os.path.exists(checkpoint)
+
+    @pytest.mark.asyncio
+    async def test_blocked_and_retry_after(self, tmp_path):
+        """測試封鎖、不存在的聊天室與 RetryAfter 重試"""
+        registry = make_registry(tmp_path, [1, 2, 3, 4])
+        sender = FakeSender(
+            {
+                1: Forbidden("bot was blocked by the user"),
+                2: BadRequest("Chat not found"),
+                3: RetryAfter(0),
+            }
+        )
+        engine = BroadcastEngine(
+            registry, sender, str(tmp_path / "checkpoint.json"), rate=1000
+        )
+
+        job = engine.start("hello", report_chat_id=99)
+        await wait_for_engine(engine)
+
+        assert sorted(sender.sent) == [3, 4]
+        assert (job.sent, job.blocked, job.failed) == (2, 2, 0)
+
+    @pytest.mark.asyncio
+    async def test_dead_chats_skipped_next_time(self, tmp_path):
+        """測試封鎖或不存在的聊天室在之後的廣播中略過"""
+        registry = make_registry(tmp_path, [1, 2, 3])
+        checkpoint = str(tmp_path / "checkpoint.json")
+        sender = FakeSender({1: Forbidden("blocked"), 2: BadRequest("Chat not found")})
+        engine = BroadcastEngine(registry, sender, checkpoint, rate=1000)
+        engine.start("first", report_chat_id=99)
+        await wait_for_engine(engine)
+
+        sender.sent.clear()
+        job = engine.start("second", report_chat_id=99)
+        await wait_for_engine(engine)
+
+        assert sender.sent == [3]
+        assert (job.sent, job.blocked, job.skipped) == (1, 0, 2)
+
+    @pytest.mark.asyncio
+    async def test_migrated_chat_sent_once(self, tmp_path):
+        """測試群組遷移後，之後的廣播只送到新 ID 一次"""
+        registry = make_registry(tmp_path, [-100])
+        sender = FakeSender({-100: ChatMigrated(-200)})
+        engine = BroadcastEngine(
+            registry, sender, str(tmp_path / "checkpoint.json"), rate=1000
+        )
+        engine.start("first", report_chat_id=99)
+        await wait_for_engine(engine)
+        assert sender.sent == [-200]
+
+        sender.sent.clear()
+        sender.errors[-100] = ChatMigrated(-200)
+        engine.start("second", report_chat_id=99)
+        await wait_for_engine(engine)
+        assert sender.sent == [-200]
+
+    @pytest.mark.asyncio
+    async def test_migration_to_registered_chat_not_resent(self, tmp_path):
+        """測試遷移目標已登記時不重送，由新 ID 自己的紀錄負責"""
+        registry = make_registry(tmp_path, [-100, -200])
+        sender = FakeSender({-100: ChatMigrated(-200)})
+        engine = BroadcastEngine(
+            registry, sender, str(tmp_path / "checkpoint.json"), rate=1000
+        )
+        job = engine.start("hello", report_chat_id=99)
+        await wait_for_engine(engine)
+
+        assert sender.sent == [-200]
+        assert (job.sent, job.skipped) == (1, 1)
+
+    @pytest.mark.asyncio
+    async def test_resume_from_checkpoint(self, tmp_path):
+        """測試從檢查點接續未完成的廣播"""
+        registry = make_registry(tmp_path, [1, 2, 3, 4, 5])
+        checkpoint = tmp_path / "checkpoint.json"
+        interrupted = BroadcastJob(
+            job_id="abc", text="hi", total=5, report_chat_id=99, offset=3, sent=3
+        )
+        checkpoint.write_text(json.dumps(interrupted.to_dict()), encoding="utf-8")
+
+        sender = FakeSender()
+        engine = BroadcastEngine(registry, sender, str(checkpoint), rate=1000)
+        job = engine.resume()
+        await wait_for_engine(engine)
+
+        assert job.job_id == "abc"
+        assert sender.sent == [4, 5]
+        assert job.sent == 5
+        assert not checkpoint.exists()
+
+    @pytest.mark.asyncio
+    async def test_stop_keeps_checkpoint(self, tmp_path):
+        """測試中途停止時保留檢查點，cancel 則刪除"""
+        registry = make_registry(tmp_path, range(1, 101))
+        checkpoint = str(tmp_path / "checkpoint.json")
+        engine = BroadcastEngine(
+            registry, FakeSender(), checkpoint, rate=200, batch_size=5
+        )
+
+        engine.start("hello", report_chat_id=99)
+        await asyncio.sleep(0.1)
+        await engine.stop()
+        with open(checkpoint, encoding="utf-8") as f:
+            saved = json.load(f)
+        assert 0 < saved["offset"] < 100
+
+        assert engine.resume() is not None
+        await engine.cancel()
+        assert not os.path.exists(checkpoint)
+
+    @pytest.mark.asyncio
+    async def test_progress_reports(self, tmp_path):
+        """測試進度回報包含速率與完成狀態"""
+        registry = make_registry(tmp_path, range(1, 11))
+        reports = []
+
+        async def on_progress(job, progress):
+            reports.append(progress)
+
+        engine = BroadcastEngine(
+            registry,
+            FakeSender(),
+            str(tmp_path / "checkpoint.json"),
+            rate=1000,
+            batch_size=2,
+            progress_interval=0,
+            on_progress=on_progress,
+        )
+        engine.start("hello", report_chat_id=99)
+        await wait_for_engine(engine)
+
+        final = reports[-1]
+        assert final.processed == final.total == 10
+        assert final.eta_seconds == 0
+        assert "10/10" in final.to_text()
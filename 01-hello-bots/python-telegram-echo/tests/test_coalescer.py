@@ -0,0 +1,276 @@
+"""
+訊息合併器單元測試
+驗證 debounce 視窗、最長延遲與 4096 字元切分
+"""
+
+import asyncio
+import json
+
+import pytest
+from telegram.ext import ApplicationBuilder
+from telegram.request import BaseRequest
+
+from messaging.coalescer import (
+    TELEGRAM_MESSAGE_LIMIT,
+    MessageCoalescer,
+    split_for_telegram,
+    telegram_length,
+)
+
+
+class RecordingSender:
+    """記錄每次送出內容的假 send 回呼"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def __call__(self, target, text):
+        self.sent.append((target, text))
+
+
+class FakeBotAPIRequest(BaseRequest):
+    """
+    假的 Bot API 連線
+
+    與 HTTPXRequest 相同，shutdown 之後的呼叫會失敗，
+    用來確認訊息是在 bot 連線關閉前送出。
+    """
+
+    def __init__(self):
+        self.initialized = False
+        self.sent = []
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        self.initialized = True
+
+    async def shutdown(self):
+        self.initialized = False
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if not self.initialized:
+            raise RuntimeError("This HTTPXRequest is not initialized!")
+        endpoint = url.rsplit("/", 1)[-1]
+        result = True
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}
+        elif endpoint == "getUpdates":
+            await asyncio.sleep(0.01)
+            result = []
+        elif endpoint == "sendMessage":
+            params = request_data.parameters
+            self.sent.append((params["chat_id"], params["text"]))
+            result = {
+                "message_id": len(self.sent),
+                "date": 0,
+                "chat": {"id": params["chat_id"], "type": "private"},
+                "text": params["text"],
+            }
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class TestSplitForTelegram:
+    """測試訊息切分"""
+
+    def test_joins_parts_with_separator(self):
+        """測試多段文字以換行合併"""
+        assert split_for_telegram(["a", "b", "c"]) == ["a\nb\nc"]
+
+    def test_respects_limit(self):
+        """測試合併後每則都不超過上限"""
+        parts = ["x" * 3000, "y" * 3000, "z" * 10]
+        chunks = split_for_telegram(parts)
+
+        assert chunks == ["x" * 3000, "y" * 3000 + "\n" + "z" * 10]
+        assert all(len(chunk) <= TELEGRAM_MESSAGE_LIMIT for chunk in chunks)
+
+    def test_hard_splits_oversized_part(self):
+        """測試單段超長文字會被硬切"""
+        chunks = split_for_telegram(["a" * 10], limit=4)
+        assert chunks == ["aaaa", "aaaa", "aa"]
+
+    def test_counts_utf16_units(self):
+        """測試以 UTF-16 長度計算，emoji 算 2 且不會被切開"""
+        assert telegram_length("a😀") == 3
+
+        chunks = split_for_telegram(["😀" * 3], limit=4)
+        assert chunks == ["😀😀", "😀"]
+
+        parts = ["😀" * 2000, "😀" * 100]
+        chunks = split_for_telegram(parts)
+        assert chunks == ["😀" * 2000, "😀" * 100]
+        assert all(telegram_length(c) <= TELEGRAM_MESSAGE_LIMIT for c in chunks)
+
+
+class TestMessageCoalescer:
+    """測試 MessageCoalescer"""
+
+    def test_invalid_window(self):
+        """測試 max_delay 小於 window 時拒絕建立"""
+        with pytest.raises(ValueError):
+            MessageCoalescer(RecordingSender(), window=1.0, max_delay=0.5)
+
+    @pytest.mark.asyncio
+    async def test_merges_rapid_messages(self):
+        """測試視窗內的連續訊息合併為一則回覆"""
+        sender = RecordingSender()
+        coalescer = MessageCoalescer(sender, window=0.05, max_delay=1.0)
+
+        for index in range(5):
+            coalescer.submit(1, f"msg-{index}", f"line {index}")
+        await asyncio.sleep(0.15)
+
+        assert sender.sent == [("msg-4", "line 0\nline 1\nline 2\nline 3\nline 4")]
+        assert coalescer.pending_chats == 0
+        await coalescer.close()
+
+    @pytest.mark.asyncio
+    async def test_chats_are_independent(self):
+        """測試不同聊天室各自合併"""
+        sender = RecordingSender()
+        coalescer = MessageCoalescer(sender, window=0.05, max_delay=1.0)
+
+        coalescer.submit(1, "a", "from 1")
+        coalescer.submit(2, "b", "from 2")
+        coalescer.submit(1, "a", "again 1")
+        await asyncio.sleep(0.15)
+
+        assert sorted(sender.sent) == [("a", "from 1\nagain 1"), ("b", "from 2")]
+        await coalescer.close()
+
+    @pytest.mark.asyncio
+    async def test_max_delay_caps_debounce(self):
+        """測試持續有訊息時，最晚在 max_delay 後送出"""
+        sender = RecordingSender()
+        coalescer = MessageCoalescer(sender, window=0.05, max_delay=0.1)
+
+        for index in range(6):
+            coalescer.submit(1, "m", str(index))
+            await asyncio.sleep(0.03)
+
+        assert len(sender.sent) >= 1
+        await coalescer.close()
+        merged = "\n".join(text for _, text in sender.sent)
+        assert merged == "0\n1\n2\n3\n4\n5"
+
+    @pytest.mark.asyncio
+    async def test_full_buffer_flushes_immediately(self):
+        """測試累積達到字數上限時立即送出"""
+        sender = RecordingSender()
+        coalescer = MessageCoalescer(sender, window=10.0, max_delay=10.0, limit=10)
+
+        coalescer.submit(1, "m", "0123456789")
+        await asyncio.sleep(0.01)
+
+        assert sender.sent == [("m", "0123456789")]
+        await coalescer.close()
+
+    @pytest.mark.asyncio
+    async def test_slow_send_does_not_delay_other_chats(self):
+        """測試某聊天室發送緩慢時不影響其他聊天室"""
+        sender = RecordingSender()
+        sent_at = {}
+        started = asyncio.get_running_loop().time()
+
+        async def slow_for_chat_1(target, text):
+            if target == "slow":
+                await asyncio.sleep(1.0)
+            sent_at[target] = asyncio.get_running_loop().time() - started
+            await sender(target, text)
+
+        coalescer = MessageCoalescer(slow_for_chat_1, window=0.05, max_delay=1.0)
+        coalescer.submit(1, "slow", "a")
+        await asyncio.sleep(0.08)
+        coalescer.submit(2, "fast", "b")
+        await asyncio.sleep(0.15)
+
+        assert sent_at["fast"] < 0.3
+        await coalescer.close()
+        assert sorted(sender.sent) == [("fast", "b"), ("slow", "a")]
+
+    @pytest.mark.asyncio
+    async def test_keeps_order_within_chat(self):
+        """測試同一聊天室的回覆依序送出，即使前一批仍在發送中"""
+        sent = []
+
+        async def slow_first(target, text):
+            if text == "first":
+                await asyncio.sleep(0.2)
+            sent.append(text)
+
+        coalescer = MessageCoalescer(slow_first, window=0.02, max_delay=0.02)
+        coalescer.submit(1, "m", "first")
+        await asyncio.sleep(0.06)
+        coalescer.submit(1, "m", "second")
+        await coalescer.close()
+
+        assert sent == ["first", "second"]
+
+    @pytest.mark.asyncio
+    async def test_failed_chunk_does_not_drop_rest(self):
+        """測試其中一則送出失敗時，其餘片段仍會送出"""
+        sent = []
+
+        async def fail_first(target, text):
+            if not sent and text.startswith("a"):
+                sent.append(None)
+                raise RuntimeError("rejected")
+            sent.append(text)
+
+        coalescer = MessageCoalescer(fail_first, window=10.0, max_delay=10.0, limit=4)
+        coalescer.submit(1, "m", "aaaa")
+        coalescer.submit(1, "m", "bbbb")
+        await coalescer.close()
+
+        assert sent == [None, "bbbb"]
+
+    @pytest.mark.asyncio
+    async def test_close_flushes_pending(self):
+        """測試關閉時送出尚未到期的內容"""
+        sender = RecordingSender()
+        coalescer = MessageCoalescer(sender, window=10.0, max_delay=10.0)
+
+        coalescer.submit(1, "m", "hello")
+        await coalescer.close()
+
+        assert sender.sent == [("m", "hello")]
+
+    def test_post_stop_flushes_before_bot_shutdown(self):
+        """測試在 post_stop 關閉時，待送內容能在 bot 連線關閉前送出"""
+        request = FakeBotAPIRequest()
+
+        async def post_init(app):
+            async def send(chat_id, text):
+                await app.bot.send_message(chat_id, text)
+
+            coalescer = MessageCoalescer(send, window=10.0, max_delay=10.0)
+            app.bot_data["echo_coalescer"] = coalescer
+            coalescer.start()
+            coalescer.submit(42, 42, "pending at shutdown")
+            # 啟動完成後才停止，模擬收到停止訊號
+            asyncio.get_running_loop().call_later(0.05, app.stop_running)
+
+        async def post_stop(app):
+            await app.bot_data["echo_coalescer"].close()
+
+        application = (
+            ApplicationBuilder()
+            .token("123:TEST")
+            .request(request)
+            .get_updates_request(FakeBotAPIRequest())
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .build()
+        )
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            application.run_polling(stop_signals=None, close_loop=False)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+        assert request.sent == [(42, "pending at shutdown")]
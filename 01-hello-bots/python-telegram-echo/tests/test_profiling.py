@@ -0,0 +1,134 @@
+"""
+取樣式效能分析器單元測試
+驗證取樣、記憶體上限與輸出格式
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from profiling.sampler import (
+    NO_HANDLER,
+    ProfileResult,
+    SamplingProfiler,
+    install_thread_attribution,
+)
+
+
+def busy_loop(stop_event: threading.Event) -> None:
+    """持續佔用 CPU 的測試用函式"""
+    while not stop_event.is_set():
+        sum(range(1000))
+
+
+def run_busy_thread(profiler: SamplingProfiler, seconds: float = 0.2) -> ProfileResult:
+    """在背景執行緒跑 busy_loop 並回傳分析結果"""
+    stop_event = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop_event,), name="busy")
+    worker.start()
+    profiler.start()
+    try:
+        time.sleep(seconds)
+    finally:
+        result = profiler.stop()
+        stop_event.set()
+        worker.join()
+    return result
+
+
+class TestSamplingProfiler:
+    """測試 SamplingProfiler"""
+
+    def test_not_running_by_default(self):
+        """測試預設不啟動背景執行緒"""
+        profiler = SamplingProfiler()
+        assert profiler.is_running is False
+
+    def test_samples_worker_threads(self):
+        """測試能取樣到背景執行緒的堆疊"""
+        profiler = SamplingProfiler(interval=0.002)
+        result = run_busy_thread(profiler)
+
+        assert profiler.is_running is False
+        assert result.samples > 0
+        collapsed = result.to_collapsed()
+        assert "busy_loop" in collapsed
+        assert any(line.startswith("busy;") for line in collapsed.splitlines())
+
+    def test_collapsed_format(self):
+        """測試 collapsed-stack 每行結尾為取樣次數"""
+        result = run_busy_thread(SamplingProfiler(interval=0.002))
+
+        for line in result.to_collapsed().strip().splitlines():
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0
+            assert ";" in stack
+
+    def test_pstats_summary(self):
+        """測試 pstats 摘要包含函式統計與 handler 分布"""
+        result = run_busy_thread(SamplingProfiler(interval=0.002))
+        summary = result.to_pstats_summary()
+
+        assert "各 handler 取樣分布" in summary
+        assert NO_HANDLER in summary
+        assert "busy_loop" in summary
+        assert "cumulative" in summary
+
+    def test_max_stacks_cap(self):
+        """測試相異堆疊數量不超過上限"""
+        profiler = SamplingProfiler(interval=0.001, max_stacks=1)
+        result = run_busy_thread(profiler)
+
+        assert len(result.stacks) <= 1
+        assert result.samples >= result.dropped
+
+    @pytest.mark.asyncio
+    async def test_worker_thread_attributed_to_handler(self):
+        """測試安裝後經 asyncio.to_thread 執行的工作歸到發起的 handler"""
+        install_thread_attribution(asyncio.get_running_loop())
+
+        def blocking_work():
+            deadline = time.monotonic() + 0.2
+            while time.monotonic() < deadline:
+                sum(range(1000))
+
+        async def fake_handler():
+            await asyncio.to_thread(blocking_work)
+
+        profiler = SamplingProfiler(interval=0.002)
+        profiler.start()
+        try:
+            await fake_handler()
+        finally:
+            result = profiler.stop()
+
+        worker_handlers = {
+            handler
+            for (thread_name, handler, frames), _ in result.stacks.items()
+            if any(name == "blocking_work" for _, _, name in frames)
+        }
+        # 最外層的專案協程是測試函式本身
+        assert worker_handlers == {"test_worker_thread_attributed_to_handler"}
+
+    @pytest.mark.asyncio
+    async def test_executor_without_profiler(self):
+        """測試分析器關閉時 executor 行為與預設 executor 相同"""
+        install_thread_attribution(asyncio.get_running_loop())
+        assert await asyncio.to_thread(lambda x: x * 2, 21) == 42
+
+    def test_start_twice_raises(self):
+        """測試重複啟動會拋出錯誤"""
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            with pytest.raises(RuntimeError):
+                profiler.start()
+        finally:
+            profiler.stop()
+
+    def test_stop_without_start_raises(self):
+        """測試未啟動即停止會拋出錯誤"""
+        with pytest.raises(RuntimeError):
+            SamplingProfiler().stop()
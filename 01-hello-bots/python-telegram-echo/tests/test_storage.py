@@ -0,0 +1,307 @@
+"""
+狀態儲存單元測試
+驗證 LRU + TTL 快取與 SQLite write-behind 持久化
+"""
+
+import asyncio
+import copy
+import sqlite3
+from datetime import datetime
+
+import pytest
+from telegram import Chat, Message, Update, User
+from telegram.ext import ApplicationBuilder, CallbackContext
+
+from storage.cache import TTLCache
+from storage.sqlite_persistence import SQLitePersistence
+
+
+class FakeClock:
+    """可手動推進的假時鐘"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def count_rows(db_path) -> int:
+    """直接查詢資料庫內的狀態筆數"""
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM state").fetchone()[0]
+
+
+async def store(persistence, kind, state_id, data) -> dict:
+    """模擬 Application 流程：handler 前 refresh，之後以 deepcopy 更新"""
+    live = {}
+    await getattr(persistence, f"refresh_{kind}_data")(state_id, live)
+    live.update(data)
+    await getattr(persistence, f"update_{kind}_data")(state_id, copy.deepcopy(live))
+    return live
+
+
+def make_update(user_id: int) -> Update:
+    """建立來自指定使用者的私訊 Update"""
+    user = User(id=user_id, first_name="tester", is_bot=False)
+    message = Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=Chat(id=user_id, type=Chat.PRIVATE),
+        from_user=user,
+        text="hi",
+    )
+    return Update(update_id=user_id, message=message)
+
+
+class TestTTLCache:
+    """測試 TTLCache"""
+
+    def test_hit_and_miss_stats(self):
+        """測試命中率統計"""
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set("a", 1)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.hits == 1
+        assert cache.misses == 1
+        assert cache.hit_rate == 0.5
+
+    def test_lru_eviction(self):
+        """測試超出容量時淘汰最久未使用的項目"""
+        evicted = []
+        cache = TTLCache(maxsize=2, ttl=10, on_evict=lambda k, v: evicted.append(k))
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert evicted == ["b"]
+        assert "a" in cache and "c" in cache
+        assert len(cache) == 2
+
+    def test_ttl_expiry(self):
+        """測試項目過期後視為未命中並觸發 on_evict"""
+        clock = FakeClock()
+        evicted = []
+        cache = TTLCache(
+            maxsize=2, ttl=5, on_evict=lambda k, v: evicted.append(k), timer=clock
+        )
+        cache.set("a", 1)
+        clock.now = 5
+
+        assert cache.get("a") is None
+        assert evicted == ["a"]
+
+    def test_sliding_ttl(self):
+        """測試 sliding 模式下命中會延長存活時間"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=2, ttl=5, sliding=True, timer=clock)
+        cache.set("a", 1)
+        clock.now = 4
+        assert cache.get("a") == 1
+        clock.now = 8
+
+        assert cache.get("a") == 1
+
+    def test_purge_expired(self):
+        """測試批次移除過期項目"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=5, ttl=5, timer=clock)
+        cache.set("a", 1)
+        clock.now = 3
+        cache.set("b", 2)
+        clock.now = 6
+
+        assert cache.purge_expired() == 1
+        assert cache.items() == [("b", 2)]
+
+    def test_invalid_arguments(self):
+        """測試容量或存活時間不合法時拒絕建立"""
+        with pytest.raises(ValueError):
+            TTLCache(maxsize=0, ttl=1)
+
+
+class TestSQLitePersistence:
+    """測試 SQLitePersistence"""
+
+    @pytest.mark.asyncio
+    async def test_nothing_loaded_at_startup(self, tmp_path):
+        """測試啟動時不預先載入資料"""
+        persistence = SQLitePersistence(str(tmp_path / "state.db"))
+        assert await persistence.get_user_data() == {}
+        assert await persistence.get_chat_data() == {}
+
+    @pytest.mark.asyncio
+    async def test_lazy_load_after_restart(self, tmp_path):
+        """測試重啟後第一次存取才從資料庫載入"""
+        db_path = str(tmp_path / "state.db")
+        first = SQLitePersistence(db_path)
+        user_data = {}
+        await first.refresh_user_data(1, user_data)
+        user_data["lang"] = "zh-TW"
+        await first.update_user_data(1, user_data)
+        await first.flush()
+
+        second = SQLitePersistence(db_path)
+        reloaded = {}
+        await second.refresh_user_data(1, reloaded)
+
+        assert reloaded == {"lang": "zh-TW"}
+        assert second.stats.misses == 1
+
+    @pytest.mark.asyncio
+    async def test_write_behind_batches(self, tmp_path):
+        """測試變更累積到 batch_size 才批次寫入"""
+        db_path = str(tmp_path / "state.db")
+        persistence = SQLitePersistence(db_path, batch_size=2, flush_interval=3600)
+
+        await store(persistence, "user", 1, {"count": 1})
+        assert persistence.stats.dirty == 1
+        assert persistence.stats.flushes == 0
+
+        await store(persistence, "chat", 2, {"count": 2})
+        stats = persistence.stats
+        assert stats.dirty == 0
+        assert stats.flushes == 1
+        assert stats.rows_written == 2
+        assert count_rows(db_path) == 2
+
+    @pytest.mark.asyncio
+    async def test_unchanged_data_not_dirty(self, tmp_path):
+        """測試資料未變更時不會被標記為待寫入"""
+        persistence = SQLitePersistence(str(tmp_path / "state.db"))
+        user_data = {}
+        await persistence.refresh_user_data(1, user_data)
+        await persistence.update_user_data(1, user_data)
+
+        assert persistence.stats.dirty == 0
+
+    @pytest.mark.asyncio
+    async def test_eviction_releases_memory_and_reloads(self, tmp_path):
+        """測試淘汰時清空 dict，下次存取再載入原資料"""
+        persistence = SQLitePersistence(
+            str(tmp_path / "state.db"), max_entries=1, flush_interval=3600
+        )
+        first = {}
+        await persistence.refresh_user_data(1, first)
+        first["score"] = 10
+
+        await persistence.refresh_user_data(2, {})
+        assert first == {}
+        assert persistence.stats.evictions == 1
+        assert persistence.stats.dirty == 1
+
+        await persistence.refresh_user_data(1, first)
+        assert first == {"score": 10}
+
+    @pytest.mark.asyncio
+    async def test_drop_user_data(self, tmp_path):
+        """測試刪除資料會同步刪除資料庫內容"""
+        db_path = str(tmp_path / "state.db")
+        persistence = SQLitePersistence(db_path)
+        await store(persistence, "user", 1, {"a": 1})
+        await persistence.flush_dirty()
+        assert count_rows(db_path) == 1
+
+        await persistence.drop_user_data(1)
+        await persistence.flush()
+        assert count_rows(db_path) == 0
+
+    @pytest.mark.asyncio
+    async def test_overlapping_flushes(self, tmp_path):
+        """測試寫入進行中又觸發寫入時，兩批都完整寫入"""
+        db_path = str(tmp_path / "state.db")
+        persistence = SQLitePersistence(db_path, flush_interval=3600)
+        await store(persistence, "user", 1, {"a": 1})
+        first_flush = asyncio.create_task(persistence.flush_dirty())
+        await asyncio.sleep(0)
+        await store(persistence, "user", 2, {"b": 2})
+
+        await asyncio.gather(first_flush, persistence.flush_dirty())
+
+        assert count_rows(db_path) == 2
+        assert persistence.stats.rows_written == 2
+
+    @pytest.mark.asyncio
+    async def test_uses_wal_journal(self, tmp_path):
+        """測試資料庫使用 WAL 模式"""
+        db_path = str(tmp_path / "state.db")
+        persistence = SQLitePersistence(db_path)
+        await store(persistence, "user", 1, {"a": 1})
+        await persistence.flush()
+
+        with sqlite3.connect(db_path) as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+class TestSQLitePersistenceWithApplication:
+    """以真正的 Application.update_persistence() 驗證持久化流程"""
+
+    async def handle(self, application, user_id: int) -> dict:
+        """模擬 handler 執行前的 refresh，回傳 Application 持有的 user_data"""
+        context = CallbackContext.from_update(make_update(user_id), application)
+        await context.refresh_data()
+        application.mark_data_for_update_persistence(user_ids=user_id)
+        return context.user_data
+
+    @pytest.mark.asyncio
+    async def test_deleted_key_stays_deleted(self, tmp_path):
+        """測試刪除的鍵不會在下次 refresh 時復活，也會寫入資料庫"""
+        db_path = str(tmp_path / "state.db")
+        persistence = SQLitePersistence(db_path)
+        application = (
+            ApplicationBuilder().token("123:TEST").persistence(persistence).build()
+        )
+
+        user_data = await self.handle(application, 1)
+        user_data.update({"x": 1, "y": 2})
+        await application.update_persistence()
+
+        user_data = await self.handle(application, 1)
+        del user_data["x"]
+        await application.update_persistence()
+
+        assert (await self.handle(application, 1)) == {"y": 2}
+        await persistence.flush()
+
+        reloaded = {}
+        await SQLitePersistence(db_path).refresh_user_data(1, reloaded)
+        assert reloaded == {"y": 2}
+
+    @pytest.mark.asyncio
+    async def test_eviction_removes_application_entry(self, tmp_path):
+        """測試淘汰時從 Application 移除該 ID，且資料不遺失也不會刪除資料庫內容"""
+        persistence = SQLitePersistence(str(tmp_path / "state.db"), max_entries=1)
+        application = (
+            ApplicationBuilder().token("123:TEST").persistence(persistence).build()
+        )
+        persistence.attach(application)
+
+        (await self.handle(application, 1))["score"] = 10
+        (await self.handle(application, 2))["score"] = 20
+        # 使用者 1 已被淘汰，但仍在待更新清單中
+        await application.update_persistence()
+
+        assert 1 not in application.user_data
+        assert 1 not in application.chat_data
+        assert len(application.user_data) + len(application.chat_data) <= 1
+        assert (await self.handle(application, 1)) == {"score": 10}
+
+    @pytest.mark.asyncio
+    async def test_periodic_update_keeps_cache_hits(self, tmp_path):
+        """測試定期 update_persistence 不會造成額外的未命中"""
+        persistence = SQLitePersistence(str(tmp_path / "state.db"))
+        application = (
+            ApplicationBuilder().token("123:TEST").persistence(persistence).build()
+        )
+
+        for count in range(3):
+            (await self.handle(application, 1))["count"] = count
+            await application.update_persistence()
+
+        stats = persistence.stats
+        # 每次 handler 都會 refresh user_data 與 chat_data，只有第一次未命中
+        assert (stats.hits, stats.misses) == (4, 2)
+        assert stats.dirty == 1
@@ -0,0 +1,69 @@
+"""
+文字轉換單元測試
+驗證轉換結果、輸入驗證規則與結果快取
+"""
+
+import pytest
+
+from errors.exceptions import DomainRuleError, UserInputError
+from transforms.text_transforms import (
+    MAX_TRANSFORM_LENGTH,
+    TRANSFORM_TITLES,
+    TRANSFORMS,
+    TransformCache,
+    validate_transform_text,
+)
+
+
+class TestValidateTransformText:
+    """測試轉換文字驗證"""
+
+    def test_valid_text(self):
+        """測試合法文字原樣回傳"""
+        assert validate_transform_text("hello", usage_hint="x") == "hello"
+
+    def test_missing_text(self):
+        """測試缺少文字時提示使用方式"""
+        with pytest.raises(UserInputError) as exc_info:
+            validate_transform_text("", usage_hint="使用方式：/upper <文字>")
+        assert exc_info.value.hint == "使用方式：/upper <文字>"
+
+    def test_blank_text(self):
+        """測試只有空白時拋出使用者輸入錯誤"""
+        with pytest.raises(UserInputError):
+            validate_transform_text("   ", usage_hint="x")
+
+    def test_too_long(self):
+        """測試超過長度上限時拋出業務規則錯誤"""
+        with pytest.raises(DomainRuleError):
+            validate_transform_text("a" * (MAX_TRANSFORM_LENGTH + 1), usage_hint="x")
+
+
+class TestTransformCache:
+    """測試 TransformCache"""
+
+    @pytest.mark.parametrize(
+        "name, expected",
+        [
+            ("upper", "HELLO WORLD"),
+            ("lower", "hello world"),
+            ("title", "Hello World"),
+            ("reverse", "dlroW olleH"),
+        ],
+    )
+    def test_transforms(self, name, expected):
+        """測試各種轉換結果"""
+        assert TransformCache().apply(name, "Hello World") == expected
+
+    def test_every_transform_has_title(self):
+        """測試每種轉換都有顯示名稱"""
+        assert set(TRANSFORMS) == set(TRANSFORM_TITLES)
+
+    def test_repeated_query_hits_cache(self):
+        """測試相同 (轉換, 文字) 第二次查詢命中快取"""
+        cache = TransformCache()
+        cache.apply("upper", "abc")
+        cache.apply("upper", "abc")
+        cache.apply("lower", "abc")
+
+        assert cache.hit_rate == pytest.approx(1 / 3)
@@ -0,0 +1,80 @@
+"""
+文字轉換模組
+集中定義可用的文字轉換、輸入驗證規則，以及共用的轉換結果快取
+"""
+
+from typing import Callable, Dict, Tuple
+
+from errors.exceptions import DomainRuleError, UserInputError
+from storage.cache import TTLCache
+
+# 單次轉換文字長度上限
+MAX_TRANSFORM_LENGTH = 200
+
+TRANSFORMS: Dict[str, Callable[[str], str]] = {
+    "upper": str.upper,
+    "lower": str.lower,
+    "title": str.title,
+    "reverse": lambda text: text[::-1],
+}
+
+# inline 選單上顯示的名稱
+TRANSFORM_TITLES: Dict[str, str] = {
+    "upper": "全大寫",
+    "lower": "全小寫",
+    "title": "首字大寫",
+    "reverse": "反轉",
+}
+
+
+def validate_transform_text(text: str, usage_hint: str) -> str:
+    """
+    驗證要轉換的文字
+
+    Args:
+        text: 使用者輸入的文字
+        usage_hint: 缺少參數時提示的使用方式
+
+    Returns:
+        str: 驗證通過的文字
+
+    Raises:
+        UserInputError: 缺少文字或只有空白
+        DomainRuleError: 文字超過長度上限
+    """
+    if not text:
+        raise UserInputError(message="缺少要轉換的文字參數", hint=usage_hint)
+
+    if len(text) > MAX_TRANSFORM_LENGTH:
+        raise DomainRuleError(
+            message="文字長度超過限制",
+            hint=f"單次轉換文字不能超過 {MAX_TRANSFORM_LENGTH} 個字符",
+        )
+
+    if not text.strip():
+        raise UserInputError(
+            message="不能轉換空白文字", hint="請提供有內容的文字進行轉換"
+        )
+
+    return text
+
+
+class TransformCache:
+    """以 (轉換名稱, 文字) 為鍵的轉換結果快取，/upper 與 inline 查詢共用"""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 600):
+        self._cache: TTLCache[Tuple[str, str], str] = TTLCache(maxsize, ttl)
+
+    @property
+    def hit_rate(self) -> float:
+        """快取命中率"""
+        return self._cache.hit_rate
+
+    def apply(self, name: str, text: str) -> str:
+        """取得轉換結果，未命中時才實際計算"""
+        key = (name, text)
+        result = self._cache.get(key)
+        if result is None:
+            result = TRANSFORMS[name](text)
+            self._cache.set(key, result)
+        return result